@@ -1,9 +1,12 @@
 import streamlit as st
-import requests
-from bs4 import BeautifulSoup
-import json
+import httpx
+import diskcache
+from lxml import etree, html
 import pandas as pd
 import logging
+import re
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 # from langchain.prompts import PromptTemplate
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
@@ -11,115 +14,200 @@ from langchain_groq import ChatGroq
 
 # Configure logging
 logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Optional quarter digit and four-digit year of a "Fiscal Quarter" cell,
+# e.g. "Q3 2025" -> (3, 2025), "FY 2025" -> (None, 2025)
+_FQ_RE = re.compile(r'(?:Q(\d))?\D*(\d{4})')
+
+# Comments, processing instructions and whitespace-only text are never read,
+# so don't build nodes for them.
+_HTML_PARSER = html.HTMLParser(remove_comments=True, remove_pis=True, remove_blank_text=True)
+
+# Whitespace-normalized text of a cell, computed inside libxml2. Compiled up front
+# rather than re-parsing the expression for every cell.
+_CELL_TEXT = etree.XPath('normalize-space()')
+
+# Parsed table rows are persisted here for a day; quarterly figures rarely change faster
+_DISK_CACHE_DIR = '.cache/financials'
+_DISK_CACHE_TTL = 24 * 60 * 60
+
+# Cell styling for the financials table shown in the UI
+_TABLE_STYLE = {'background-color': '#f4f4f4', 'color': '#333', 'border': '1px solid #ddd'}
 #-------------------------------------------------------------------------------------------------------------
 
-def get_stock_financials(stock_url):
-    """Fetches the financials table and returns a JSON string where the original
-    rows become columns and columns become rows."""
+@st.cache_resource
+def get_client():
+    """Returns a pooled keep-alive HTTP/2 client shared across Streamlit reruns."""
+    # httpx skips its HTTPS_PROXY/NO_PROXY handling when a transport is passed
+    # explicitly, so pick up the environment proxy for stockanalysis.com here.
+    proxy = None
+    if not urllib.request.proxy_bypass("stockanalysis.com"):
+        proxy = urllib.request.getproxies().get("https")
+    transport = httpx.HTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+        retries=2,
+        proxy=proxy,
+    )
+    return httpx.Client(
+        headers={"User-Agent": "Mozilla/5.0", "Accept-Encoding": "gzip, br", "Accept": "text/html"},
+        timeout=10.0,
+        follow_redirects=True,
+        transport=transport,
+    )
+
+
+@st.cache_resource
+def get_disk_cache():
+    """Returns the on-disk cache of parsed financials, which survives app restarts."""
+    return diskcache.Cache(_DISK_CACHE_DIR)
+
+
+@st.cache_resource
+def get_executor():
+    """Returns a small thread pool for fetching pages concurrently over the shared client."""
+    return ThreadPoolExecutor(max_workers=4)
+
+
+def fetch_page(client, stock_url):
+    """Downloads a page and returns its raw bytes, or None on failure."""
     try:
-        response = requests.get(stock_url, headers={"User-Agent": "Mozilla/5.0"}, timeout=10)
+        response = client.get(stock_url)
         response.raise_for_status()
-    except requests.RequestException as e:
+    except (httpx.HTTPError, httpx.InvalidURL) as e:
         logging.error(f"❌ Error fetching the page: {e}")
         return None
+    return response.content
 
+
+def parse_financials(page):
+    """Extracts the financials table from a page and returns its rows as lists of
+    cell text (label first), plus the currency note."""
     try:
-        soup = BeautifulSoup(response.text, 'html.parser')
-        stock_table = soup.find('table')
-        currency_info=soup.find('div',class_="hidden pb-1 text-sm text-faded lg:block")
-        if not stock_table:
+        root = html.fromstring(page, parser=_HTML_PARSER)
+        stock_table = root.find('.//table')
+        currency_div = root.find('.//div[@class="hidden pb-1 text-sm text-faded lg:block"]')
+        currency_info = _CELL_TEXT(currency_div) if currency_div is not None else ""
+        if stock_table is None:
             raise ValueError("⚠️ No table found on the webpage.")
 
-        rows = stock_table.find_all("tr")
+        rows = list(stock_table.iter('tr'))
         if len(rows) < 2:
             raise ValueError("⚠️ Insufficient table data.")
 
-        headers = [th.get_text(strip=True) for th in rows[0].find_all("th")]
-        additional_row = [th.get_text(strip=True) for th in rows[1].find_all("th")]
+        headers = [_CELL_TEXT(th) for th in rows[0].iterfind('th')]
+        additional_row = [_CELL_TEXT(th) for th in rows[1].iterfind('th')]
         data = []
         for row in rows[2:]:
-            cells = [td.get_text(strip=True) for td in row.find_all("td")]
+            cells = [_CELL_TEXT(td) for td in row.iterfind('td')]
             if len(cells) == len(headers):
                 data.append(cells)
 
         if additional_row:
+            if len(additional_row) != len(headers):
+                raise ValueError("⚠️ Table header rows have different lengths.")
             data.insert(0, additional_row)
 
-        transposed_data = []
-        num_columns = len(headers)
-        for col_idx in range(num_columns):
-            transposed_row = {
-                "Header": headers[col_idx],
-                **{f"Row {i+1}": data[i][col_idx] for i in range(len(data))}
-            }
-            transposed_data.append(transposed_row)
-
-        return json.dumps(transposed_data, indent=2),currency_info
+        return [headers] + data,currency_info
     except Exception as e:
         logging.error(f"⚠️ Error processing table data: {e}")
         return None
 
 
-def convert_to_dataframe(stock_json):
-    """Convert JSON stock data into a Pandas DataFrame."""
+def build_dataframe(table_rows):
+    """Builds a DataFrame where the original table rows become columns and columns become rows."""
+    # Each table row becomes one DataFrame column, labelled by its first cell.
+    # Every cell is scraped text, so skip pandas' per-column dtype inference.
+    # Columns are keyed by position first so rows with a repeated label are kept.
+    stock_info_df = pd.DataFrame({i: row[1:] for i, row in enumerate(table_rows)}, dtype=object)
+    stock_info_df.columns = pd.Index([row[0] for row in table_rows])
+    if stock_info_df.columns.has_duplicates:
+        duplicates = stock_info_df.columns[stock_info_df.columns.duplicated()].unique().tolist()
+        logging.error(f"⚠️ Duplicate row labels in table: {duplicates}")
+    return stock_info_df
+
+
+def read_disk_cache(disk_cache, stock_url):
+    """Returns the cached (table rows, currency) pair for a page, or None if it is
+    missing or unreadable; a corrupt entry is treated as a cache miss."""
     try:
-        if not stock_json:
-            raise ValueError("⚠️ Input JSON data is empty or None.")
-        stock_data = json.loads(stock_json)
-        if not isinstance(stock_data, list) or not stock_data:
-            raise ValueError("⚠️ Invalid JSON format.")
-        return pd.DataFrame(stock_data)
-    except (json.JSONDecodeError, ValueError) as e:
-        logging.error(f"⚠️ Error decoding JSON: {e}")
+        entry = disk_cache.get(stock_url)
+        if entry is None:
+            return None
+        table_rows, currency_info = entry
+        if not isinstance(table_rows, list) or not isinstance(currency_info, str):
+            raise ValueError("⚠️ Unexpected cache entry format.")
+        return table_rows, currency_info
+    except Exception as e:
+        logging.error(f"⚠️ Ignoring unreadable cache entry for {stock_url}: {e}")
         return None
 
 
-def processed_dataframe(stock_json,columns):
+def write_disk_cache(disk_cache, stock_url, result):
+    """Stores a parsed (table rows, currency) pair; failures only cost a future refetch."""
+    try:
+        disk_cache.set(stock_url, result, expire=_DISK_CACHE_TTL)
+    except Exception as e:
+        logging.error(f"⚠️ Could not write cache entry for {stock_url}: {e}")
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def get_stock_financials(stock_urls):
+    """Fetches the given pages concurrently and returns a dict mapping each URL to
+    its (DataFrame, currency) pair. Raises ValueError if any page could not be
+    fetched or parsed, so failures are never memoized by st.cache_data.
+    Parsed table rows are kept in the on-disk cache for a day, so only misses are fetched."""
+    disk_cache = get_disk_cache()
+    results = {stock_url: read_disk_cache(disk_cache, stock_url) for stock_url in stock_urls}
+    missing = [stock_url for stock_url, result in results.items() if result is None]
+
+    client = get_client()
+    pages = get_executor().map(lambda stock_url: fetch_page(client, stock_url), missing)
+    for stock_url, page in zip(missing, pages):
+        result = parse_financials(page) if page is not None else None
+        if result is not None:
+            write_disk_cache(disk_cache, stock_url, result)
+        results[stock_url] = result
+
+    failed = [stock_url for stock_url, result in results.items() if result is None]
+    if failed:
+        raise ValueError(f"⚠️ Could not retrieve financials for: {failed}")
+    return {
+        stock_url: (build_dataframe(table_rows), currency_info)
+        for stock_url, (table_rows, currency_info) in results.items()
+    }
+
+
+@st.cache_data(ttl=3600)
+def processed_dataframe(stock_info_df,columns):
     """Processes stock data into a structured Pandas DataFrame."""
     try:
-        stock_info_df = convert_to_dataframe(stock_json)
         if stock_info_df is None or stock_info_df.empty:
             raise ValueError("⚠️ DataFrame is empty or invalid.")
-        
-        stock_info_df.columns = stock_info_df.iloc[0]
-        stock_info_df = stock_info_df[1:].reset_index(drop=True)
 
-        required_columns = ['Fiscal Quarter', 'Period Ending', 'Revenue', 'Net Income'] + columns
+        required_columns = ['Fiscal Quarter', 'Period Ending', 'Revenue', 'Net Income'] + list(columns)
         missing_cols = [col for col in required_columns if col not in stock_info_df.columns]
         if missing_cols:
             raise ValueError(f"⚠️ Missing expected columns: {missing_cols}")
 
-        stock_info_df = stock_info_df[required_columns]
+        stock_info_df = stock_info_df[required_columns].iloc[:8].copy()
         
-        stock_info_df['Year'] = stock_info_df['Fiscal Quarter'].str.extract(r'(\d{4})').fillna(0).astype(int)
-        stock_info_df['Quarter'] = 'Q' + stock_info_df['Fiscal Quarter'].str.extract(r'(?:Q)?(\d)').fillna(0).astype(int).astype(str)
+        fiscal_quarter = stock_info_df['Fiscal Quarter'].str.extract(_FQ_RE)
+        stock_info_df['Year'] = fiscal_quarter[1].fillna('0').astype('int32')
+        stock_info_df['Quarter'] = 'Q' + fiscal_quarter[0].fillna('0')
         stock_info_df.drop(columns=['Fiscal Quarter'], inplace=True)
         
-        def clean_date(date_string):
-            if not isinstance(date_string, str):
-                return None
-            if "'" in date_string:
-                date_string = date_string.split("'")[-1]
-            return pd.to_datetime(date_string.strip(), errors='coerce').date()
-        
-        stock_info_df['Period Ending'] = stock_info_df['Period Ending'].apply(clean_date)
-        stock_info_df = stock_info_df.iloc[:8].reset_index(drop=True)
+        period_ending = stock_info_df['Period Ending'].astype('string')
+        period_ending = period_ending.str.rsplit("'", n=1).str[-1].str.strip()
+        stock_info_df['Period Ending'] = pd.to_datetime(period_ending, errors='coerce').dt.date
         
         return stock_info_df
     except Exception as e:
         logging.error(f"⚠️ Error processing DataFrame: {e}")
         return None
-    
-def get_report(df,api_key):
-    llm =ChatGroq(
-       model="openai/gpt-oss-120b",
-       temperature=0.1,
-       api_key=api_key,
-    )
 
- 
 
-    sysytem_prompt = f'''
+_SYSTEM_TEMPLATE = '''
     Consider yourself as a financial analyst with 15 years of experience in analyzing company financials.
     You are given financial data for a company over the last 8 quarters (e.g., revenue, net income, etc.). Using only this data (no assumptions), generate a clear, professional, and engaging financial narrative report that follows these instructions:
 
@@ -215,17 +303,31 @@ def get_report(df,api_key):
 
   > Insights are based only on the provided data and do not represent forecasts.
 
-    {df.to_string()}'''
+    {df}'''
+
+
+@st.cache_resource
+def _get_prompt():
+    """Returns the report prompt, compiled once rather than on every rerun."""
+    return PromptTemplate.from_template(_SYSTEM_TEMPLATE + "\n{question}")
 
-    prompt_template = PromptTemplate(
-        input_variables=["question"],
-        template=sysytem_prompt + "\n" + "{question}"
+
+@st.cache_resource(max_entries=8, ttl=3600)
+def _get_llm(api_key):
+    """Returns a Groq chat client, reused across reruns for the same API key. The
+    cache is bounded so clients (and the keys they hold) don't live for the server's lifetime."""
+    return ChatGroq(
+       model="openai/gpt-oss-120b",
+       temperature=0.1,
+       api_key=api_key,
     )
 
-    chain = prompt_template|llm|StrOutputParser()
+
+def get_report(df,api_key):
+    chain = _get_prompt()|_get_llm(api_key)|StrOutputParser()
 
     result = chain.invoke(
-        {"question":"Generate Report"}
+        {"df":df.to_csv(index=False), "question":"Generate Report"}
     )
     return result
     
@@ -233,14 +335,23 @@ def get_report(df,api_key):
 
 st.title("📊 COMPANY FINANCIALS")
 st.write("🔍 This app takes ticker symbol as input and returns the financial info of the company")
-option = st.selectbox("Choose the stock exchange:", ["NASDAQ", "Other"])
-st.write("For NASDAQ:- Enter ticker symbol as is (e.g.,TSLA,NVDA)")
-st.write("For other:- stockexchange:ticker symbol (e.g. NSE:TATACONSUM,ETR:BMW ) ")
-ticker_symbol = st.text_input("Enter the ticker symbol:")
+with st.form("ticker_form"):
+    option = st.selectbox("Choose the stock exchange:", ["NASDAQ", "Other"])
+    st.write("For NASDAQ:- Enter ticker symbol as is (e.g.,TSLA,NVDA)")
+    st.write("For other:- stockexchange:ticker symbol (e.g. NSE:TATACONSUM,ETR:BMW ) ")
+    ticker_symbol = st.text_input("Enter the ticker symbol:")
+    submitted = st.form_submit_button("Fetch")
 #groq_api_key = st.text_input("Get your Groq API key from https://console.groq.com/home", type="password")
 
+# Remember the last submitted ticker so widget reruns below don't need a resubmit;
+# the fetched data itself comes from get_stock_financials' TTL-bound caches.
+if submitted:
+    st.session_state["query"] = (option, ticker_symbol) if ticker_symbol else None
+query = st.session_state.get("query")
+
 # Check if ticker_symbol is provided
-if ticker_symbol: #and groq_api_key:
+if query: #and groq_api_key:
+    option, ticker_symbol = query
     if option == "Other":
         if ":" in ticker_symbol:
             # Split the prefix and the rest of the ticker symbol
@@ -254,18 +365,23 @@ if ticker_symbol: #and groq_api_key:
         ticker_symbol=ticker_symbol.lower()
         stock_url = f"https://stockanalysis.com/stocks/{ticker_symbol}/financials/?p=quarterly"
 
-    stock_info,currency_info = get_stock_financials(stock_url)
-    if stock_info:
+    try:
+        stock_info,currency_info = get_stock_financials((stock_url,))[stock_url]
+    except ValueError as e:
+        logging.error(e)
+        stock_info,currency_info = None, None
+        st.error("❌ Failed to fetch the financial data. Please check the ticker and try again.")
+
+    if stock_info is not None:
         #columns = st.multiselect("Select the additional data you need:",)
         exclude_values = {'Fiscal Quarter', 'Period Ending', 'Revenue', 'Net Income'}
-        stock_json = json.loads(stock_info)
-        columns_names = [value for value in stock_json[0].values() if value not in exclude_values]
+        columns_names = [value for value in stock_info.columns if value not in exclude_values]
         columns = st.multiselect("Select additional data:", options=columns_names)
-        stock_info_df = processed_dataframe(stock_info,columns)
+        stock_info_df = processed_dataframe(stock_info,tuple(columns))
         if stock_info_df is not None:
             st.write("✅ Financial Data Successfully Retrieved!")
-            st.write(f"{currency_info.text}")
-            st.dataframe(stock_info_df.style.set_properties(**{'background-color': '#f4f4f4', 'color': '#333', 'border': '1px solid #ddd'}))
+            st.write(currency_info)
+            st.dataframe(stock_info_df.style.set_properties(**_TABLE_STYLE))
             st.write("Get your Groq API key from https://console.groq.com/home and Click below button to generate report")
             groq_api_key = st.text_input("Enter API Key", type="password")
             if groq_api_key:
@@ -276,8 +392,6 @@ if ticker_symbol: #and groq_api_key:
                         st.write(report)
         else:
             st.error("❌ Failed to process the financial data.")
-    else:
-        st.error("❌ Failed to fetch the financial data.")
 
 
 